@@ -1,46 +1,137 @@
 #!/usr/bin/env python3
 import os
-import subprocess
+import asyncio
 import argparse
 
-def run_command(command, cwd=None):
-    """Execute a command and return status, output, and error."""
-    process = subprocess.Popen(command, 
-                               stdout=subprocess.PIPE, 
-                               stderr=subprocess.PIPE,
-                               universal_newlines=True,
-                               shell=True,
-                               cwd=cwd)
-    stdout, stderr = process.communicate()
-    return process.returncode == 0, stdout, stderr
-
-def generate_amber_params(base_directory, indices=None, num_jobs=None):
-    parent_dir = os.path.dirname(base_directory)
-    job_dirs = {}
-    
-    for item in os.listdir(parent_dir):
-        if item == os.path.basename(base_directory):
-            continue
+# tleap input is identical for every job, so encode it once at import time
+TLEAP_INPUT = b"""source leaprc.gaff
+loadamberprep MOL.prepi
+loadAmberParams MOL.frcmod
+LIG = loadpdb MOL.pdb
+saveAmberParm LIG lig.top lig.crd
+quit
+"""
+
+def discover_jobs(parent_dir, require, exclude=None):
+    """Return sorted (name, path) pairs for job folders in parent_dir holding every required file."""
+    job_dirs = []
+    with os.scandir(parent_dir) as entries:
+        for entry in entries:
+            if entry.name == exclude or not entry.is_dir():
+                continue
+            prefix = entry.path + os.sep
+            if all(os.path.exists(prefix + f) for f in require):
+                job_dirs.append((entry.name, entry.path))
+    return sorted(job_dirs)
+
+async def run_command(argv, cwd=None, capture=False):
+    """Execute a command given as an argv list and return status, output, and error.
+
+    stdout is discarded (and returned as None) unless capture is True;
+    stderr is always captured so failures can be reported.
+    """
+    stdout_target = asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL
+    process = await asyncio.create_subprocess_exec(*argv,
+                                                   stdout=stdout_target,
+                                                   stderr=asyncio.subprocess.PIPE,
+                                                   cwd=cwd)
+    stdout, stderr = await process.communicate()
+    return process.returncode == 0, stdout.decode() if capture else None, stderr.decode()
+
+async def process_one(i, job_dir, resp_path, sem, capture=False):
+    """Run the antechamber/parmchk2/tleap pipeline for a single job.
+
+    Returns None on success or a failure reason string.
+    """
+    def show_output(step, out):
+        # out is None unless capture (--verbose) is set
+        if out:
+            print("{:<5} {:<30} {} output:\n{}".format(i, job_dir, step, out))
+
+    async with sem:
+        print("{:<5} {:<30} Processing...".format(i, job_dir))
+        
+        # Create amber directory
+        amber_dir = os.path.join(resp_path, 'AMBER')
+        os.makedirs(amber_dir, exist_ok=True)
+        
+        # Get input log file
+        log_file = os.path.join(resp_path, 'mpp.log')
+        
+        # Run antechamber for mol2
+        mol2_cmd = ["antechamber", "-fi", "gout", "-fo", "mol2", "-pf", "y", "-i", log_file, "-o", "MOL.mol2", "-c", "resp"]
+        success_mol2, out_mol2, err_mol2 = await run_command(mol2_cmd, cwd=amber_dir, capture=capture)
+        show_output("antechamber (mol2)", out_mol2)
+        
+        if not success_mol2:
+            print("{:<5} {:<30} Failed at mol2 generation".format(i, job_dir))
+            return "mol2 generation failed"
             
-        full_path = os.path.join(parent_dir, item)
-        if os.path.isdir(full_path):
-            resp_dir = os.path.join(full_path, 'RESP')
-            if os.path.exists(resp_dir):
-                mpp_log = os.path.join(resp_dir, 'mpp.log')
-                if os.path.exists(mpp_log):
-                    job_dirs[item] = resp_dir
+        # Run antechamber for prepi
+        prepi_cmd = ["antechamber", "-fi", "gout", "-fo", "prepi", "-pf", "y", "-i", log_file, "-o", "MOL.prepi", "-c", "resp"]
+        success_prepi, out_prepi, err_prepi = await run_command(prepi_cmd, cwd=amber_dir, capture=capture)
+        show_output("antechamber (prepi)", out_prepi)
+        
+        if not success_prepi:
+            print("{:<5} {:<30} Failed at prepi generation".format(i, job_dir))
+            return "prepi generation failed"
+        
+        # Run parmchk2
+        parmchk_cmd = ["parmchk2", "-f", "prepi", "-i", "MOL.prepi", "-o", "MOL.frcmod"]
+        success_parm, out_parm, err_parm = await run_command(parmchk_cmd, cwd=amber_dir, capture=capture)
+        show_output("parmchk2", out_parm)
+        
+        if not success_parm:
+            print("{:<5} {:<30} Failed at parmchk2".format(i, job_dir))
+            return "parmchk2 failed"
+            
+        # Run antechamber to generate PDB
+        pdb_cmd = ["antechamber", "-fi", "prepi", "-fo", "pdb", "-i", "MOL.prepi", "-o", "MOL.pdb"]
+        success_pdb, out_pdb, err_pdb = await run_command(pdb_cmd, cwd=amber_dir, capture=capture)
+        show_output("antechamber (pdb)", out_pdb)
+        
+        if not success_pdb:
+            print("{:<5} {:<30} Failed at PDB generation".format(i, job_dir))
+            return "PDB generation failed"
+        
+        # Create tleap input file
+        tleap_input_path = os.path.join(amber_dir, 'tleap.in')
+        with open(tleap_input_path, 'wb') as f:
+            f.write(TLEAP_INPUT)
+        
+        # Run tleap
+        tleap_cmd = ["tleap", "-f", "tleap.in"]
+        success_tleap, out_tleap, err_tleap = await run_command(tleap_cmd, cwd=amber_dir, capture=capture)
+        show_output("tleap", out_tleap)
+
+        if not success_tleap:
+            print("{:<5} {:<30} Failed at tleap".format(i, job_dir))
+            # Print the stderr for debugging
+            print("tleap error output:\n", err_tleap)
+            return f"tleap failed:\n{err_tleap}"
+
+        # If all steps successful
+        print("{:<5} {:<30} Completed".format(i, job_dir))
+        return None
+
+def generate_amber_params(base_directory, indices=None, num_jobs=None, max_concurrent=None,
+                          verbose=False):
+    parent_dir = os.path.dirname(base_directory)
+    # Jobs come back already sorted by name
+    sorted_jobs = [
+        (name, os.path.join(path, 'RESP'))
+        for name, path in discover_jobs(parent_dir, ('RESP/mpp.log',),
+                                        exclude=os.path.basename(base_directory))
+    ]
     
-    if not job_dirs:
+    if not sorted_jobs:
         print("\nNo completed RESP calculations found!")
         return
 
-    # Sort the jobs
-    sorted_jobs = sorted(job_dirs.items())
-    
     # Handle job selection
     if indices:
         try:
-            selected_jobs = [(sorted_jobs[i-1][0], sorted_jobs[i-1][1]) for i in indices]
+            selected_jobs = [sorted_jobs[i-1] for i in indices]
         except IndexError:
             print("Error: Invalid job indices provided")
             return
@@ -50,90 +141,30 @@ def generate_amber_params(base_directory, indices=None, num_jobs=None):
         selected_jobs = sorted_jobs
 
     print("\nFound {} completed RESP calculations, processing {} jobs:".format(
-        len(job_dirs), len(selected_jobs)))
+        len(sorted_jobs), len(selected_jobs)))
     print("{:<5} {:<30} {:<10}".format("Index", "Directory", "Status"))
     print("-" * 45)
     
+    # Jobs are independent, so run up to max_concurrent pipelines at once
+    async def _run_all():
+        sem = asyncio.Semaphore(max_concurrent or os.cpu_count() or 1)
+        tasks = [process_one(i, job_dir, resp_path, sem, capture=verbose)
+                 for i, (job_dir, resp_path) in enumerate(selected_jobs, 1)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(_run_all())
+    
     successful = []
     failed = []
     
-    for i, (job_dir, resp_path) in enumerate(selected_jobs, 1):
-        print("{:<5} {:<30} Processing...".format(i, job_dir))
-        
-        # Create amber directory
-        amber_dir = os.path.join(resp_path, 'AMBER')
-        os.makedirs(amber_dir, exist_ok=True)
-        
-        # Get input log file
-        log_file = os.path.join(resp_path, 'mpp.log')
-        
-        try:
-            # Run antechamber for mol2
-            mol2_cmd = f"antechamber -fi gout -fo mol2 -pf y -i {log_file} -o MOL.mol2 -c resp"
-            success_mol2, out_mol2, err_mol2 = run_command(mol2_cmd, cwd=amber_dir)
-            
-            if not success_mol2:
-                failed.append((job_dir, "mol2 generation failed"))
-                print("{:<5} {:<30} Failed at mol2 generation".format(i, job_dir))
-                continue
-                
-            # Run antechamber for prepi
-            prepi_cmd = f"antechamber -fi gout -fo prepi -pf y -i {log_file} -o MOL.prepi -c resp"
-            success_prepi, out_prepi, err_prepi = run_command(prepi_cmd, cwd=amber_dir)
-            
-            if not success_prepi:
-                failed.append((job_dir, "prepi generation failed"))
-                print("{:<5} {:<30} Failed at prepi generation".format(i, job_dir))
-                continue
-            
-            # Run parmchk2
-            parmchk_cmd = f"parmchk2 -f prepi -i MOL.prepi -o MOL.frcmod"
-            success_parm, out_parm, err_parm = run_command(parmchk_cmd, cwd=amber_dir)
-            
-            if not success_parm:
-                failed.append((job_dir, "parmchk2 failed"))
-                print("{:<5} {:<30} Failed at parmchk2".format(i, job_dir))
-                continue
-                
-            # Run antechamber to generate PDB
-            pdb_cmd = f"antechamber -fi prepi -fo pdb -i MOL.prepi -o MOL.pdb"
-            success_pdb, out_pdb, err_pdb = run_command(pdb_cmd, cwd=amber_dir)
-            
-            if not success_pdb:
-                failed.append((job_dir, "PDB generation failed"))
-                print("{:<5} {:<30} Failed at PDB generation".format(i, job_dir))
-                continue
-            
-            # Create tleap input file
-            tleap_content = """source leaprc.gaff
-loadamberprep MOL.prepi
-loadAmberParams MOL.frcmod
-LIG = loadpdb MOL.pdb
-saveAmberParm LIG lig.top lig.crd
-quit
-"""
-            tleap_input_path = os.path.join(amber_dir, 'tleap.in')
-            with open(tleap_input_path, 'w') as f:
-                f.write(tleap_content)
-            
-            # Run tleap
-            tleap_cmd = f"tleap -f tleap.in"
-            success_tleap, out_tleap, err_tleap = run_command(tleap_cmd, cwd=amber_dir)
-
-            if not success_tleap:
-                failed.append((job_dir, f"tleap failed:\n{err_tleap}"))
-                print("{:<5} {:<30} Failed at tleap".format(i, job_dir))
-                # Print the stderr for debugging
-                print("tleap error output:\n", err_tleap)
-                continue
-
-            # If all steps successful
-            successful.append(job_dir)
-            print("{:<5} {:<30} Completed".format(i, job_dir))
-            
-        except Exception as e:
-            failed.append((job_dir, str(e)))
-            print("{:<5} {:<30} Error: {}".format(i, job_dir, str(e)))
+    for i, ((job_dir, resp_path), result) in enumerate(zip(selected_jobs, results), 1):
+        if isinstance(result, Exception):
+            failed.append((job_dir, str(result)))
+            print("{:<5} {:<30} Error: {}".format(i, job_dir, str(result)))
+        elif result is not None:
+            failed.append((job_dir, result))
+        else:
+            successful.append((job_dir, resp_path))
     
     # Print summary
     print("\nParameter Generation Summary:")
@@ -142,18 +173,25 @@ quit
     
     if successful:
         print("\nSuccessful jobs:")
-        for job in successful:
-            amber_dir = os.path.join(parent_dir, job, 'RESP', 'AMBER')
+        for job, resp_path in successful:
+            prefix = os.path.join(resp_path, 'AMBER') + os.sep
             print(f"- {job}")
             print("  Files generated:")
-            for f in ["MOL.mol2", "MOL.prepi", "MOL.frcmod", "MOL.pdb", "lig.top", "lig.crd"]:
-                print(f"  - {os.path.join(amber_dir, f)}")
+            for f in ("MOL.mol2", "MOL.prepi", "MOL.frcmod", "MOL.pdb", "lig.top", "lig.crd"):
+                print(f"  - {prefix}{f}")
     
     if failed:
         print("\nFailed jobs:")
         for job, reason in failed:
             print(f"- {job}: {reason}")
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description='Generate Amber parameters from RESP calculations.')
     group = parser.add_mutually_exclusive_group()
@@ -162,6 +200,7 @@ def main():
     group.add_argument('-a', '--all', action='store_true', help='Process all jobs (default)')
     parser.add_argument('-l', '--list', action='store_true', help='List available jobs without processing')
     parser.add_argument('-v', '--verbose', action='store_true', help='Show detailed output')
+    parser.add_argument('-p', '--parallel', type=positive_int, help='Maximum number of jobs to run concurrently (default: CPU count)')
     args = parser.parse_args()
     
     base_directory = os.getcwd()
@@ -175,7 +214,8 @@ def main():
             print("Error: Invalid indices format. Use comma-separated numbers (e.g., 1,3,5)")
             return
     
-    generate_amber_params(base_directory, indices=indices, num_jobs=args.number)
+    generate_amber_params(base_directory, indices=indices, num_jobs=args.number,
+                          max_concurrent=args.parallel, verbose=args.verbose)
 
 if __name__ == "__main__":
     main()
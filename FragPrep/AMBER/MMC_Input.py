@@ -1,93 +1,104 @@
 #!/usr/bin/env python3
+import io
 import os
 import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 
+def discover_jobs(parent_dir, require, exclude=None):
+    """Return sorted (name, path) pairs for job folders in parent_dir holding every required file."""
+    job_dirs = []
+    with os.scandir(parent_dir) as entries:
+        for entry in entries:
+            if entry.name == exclude or not entry.is_dir():
+                continue
+            prefix = entry.path + os.sep
+            if all(os.path.exists(prefix + f) for f in require):
+                job_dirs.append((entry.name, entry.path))
+    return sorted(job_dirs)
+
+def format_num(val: float) -> str:
+    """Format a number to exact width (8 chars including sign)"""
+    if val >= 0:
+        return f" {abs(val):7.5f}"  # space + 7 chars
+    return f"-{abs(val):7.5f}"  # minus + 7 chars
+
+def read_lines(path: str) -> List[str]:
+    """Read a whole file in one call and split it into lines"""
+    with open(path, 'rb') as f:
+        return f.read().decode('ascii', 'replace').splitlines()
+
 class MoleculeConverter:
     def __init__(self):
         self.atoms_data = {}
-        self.coords = {}
+        # Per-atom data is stored as flat arrays indexed by PDB position
+        self.xyz = array('d')
+        self.charges = array('d')
+        self.atom_index = {}
         self.atom_types = {}
-        self.charges = {}
         self.atom_order = []
 
     def read_pdb_file(self, pdb_path: str) -> None:
         """Extract coordinates and atom sequence from PDB file"""
-        with open(pdb_path, 'r') as f:
-            for line in f:
-                if line.startswith('ATOM'):
-                    atom_num = int(line[6:11].strip())
-                    atom_name = line[12:16].strip()
-                    x = float(line[30:38])
-                    y = float(line[38:46])
-                    z = float(line[46:54])
-                    self.coords[atom_name] = (x, y, z)
-                    self.atom_order.append(atom_name)
+        for line in read_lines(pdb_path):
+            if line.startswith('ATOM'):
+                atom_num = int(line[6:11].strip())
+                atom_name = line[12:16].strip()
+                self.atom_index[atom_name] = len(self.atom_order)
+                self.xyz.extend((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+                self.atom_order.append(atom_name)
 
     def read_prepi_file(self, prepi_path: str) -> None:
         """Extract atom types from PREPI file"""
-        with open(prepi_path, 'r') as f:
-            lines = f.readlines()
-            start_processing = False
-            
-            for line in lines:
-                if 'CORRECT' in line:
-                    start_processing = True
-                    continue
-                if start_processing and 'LOOP' in line:
-                    break
-                if start_processing and line.strip() and 'DUMM' not in line:
-                    parts = line.strip().split()
-                    if len(parts) >= 8:
-                        atom_name = parts[1]
-                        atom_type = parts[2]
-                        self.atom_types[atom_name] = atom_type
+        lines = read_lines(prepi_path)
+        start_processing = False
+        
+        for line in lines:
+            if 'CORRECT' in line:
+                start_processing = True
+                continue
+            if start_processing and 'LOOP' in line:
+                break
+            if start_processing and line.strip() and 'DUMM' not in line:
+                parts = line.strip().split()
+                if len(parts) >= 8:
+                    atom_name = parts[1]
+                    atom_type = parts[2]
+                    self.atom_types[atom_name] = atom_type
 
     def read_top_file(self, top_path: str) -> None:
         """Extract charges from TOP file"""
-        with open(top_path, 'r') as f:
-            lines = f.readlines()
-            
-            charge_section = False
-            for i, line in enumerate(lines):
-                if '%FLAG CHARGE' in line:
-                    charge_start = i + 2
-                    charge_section = True
-                    continue
-                if charge_section and '%FLAG' in line:
-                    charge_end = i
-                    break
-                    
-            if charge_section:
-                charges = []
-                for line in lines[charge_start:charge_end]:
-                    values = [float(line[i:i+16].strip()) for i in range(0, len(line.strip()), 16)]
-                    charges.extend(values)
-                
-                charges = [charge/18.2223 for charge in charges]
+        lines = read_lines(top_path)
+        
+        charge_section = False
+        for i, line in enumerate(lines):
+            if '%FLAG CHARGE' in line:
+                charge_start = i + 2
+                charge_section = True
+                continue
+            if charge_section and '%FLAG' in line:
+                charge_end = i
+                break
                 
-                for i, atom_name in enumerate(self.atom_order):
-                    if i < len(charges):
-                        self.charges[atom_name] = charges[i]
+        if charge_section:
+            # Parse the whole block in one pass and convert to electron units
+            block = '\n'.join(lines[charge_start:charge_end])
+            charges = [float(value) / 18.2223 for value in block.split()]
+            
+            self.charges = array('d', charges[:len(self.atom_order)])
 
     def format_line(self, atom_name: str) -> str:
         """Format a single line according to the required format"""
         try:
-            x, y, z = self.coords[atom_name]
+            idx = self.atom_index[atom_name]
+            x, y, z = self.xyz[3*idx:3*idx + 3]
             atom_type = self.atom_types[atom_name]
-            charge = self.charges[atom_name]
+            charge = self.charges[idx]
             
             # Format atom type (2 chars + exactly 6 spaces)
             line = f" {atom_type:<2}      "  # 1 space, atom type, 6 spaces
             
-            # Format all numbers to exact width (8 chars including sign)
-            def format_num(val):
-                if val >= 0:
-                    num_str = f" {abs(val):7.5f}"  # space + 7 chars
-                else:
-                    num_str = f"-{abs(val):7.5f}"  # minus + 7 chars
-                return num_str
-                
             # Build the line with:
             # - 2 spaces between coordinate numbers
             # - 4 spaces before "1"
@@ -100,45 +111,26 @@ class MoleculeConverter:
             
             return f"{line}{x_str}  {y_str}  {z_str}  {charge_str}    1  MOL  {atom_name}"
             
-        except KeyError as e:
-            raise Exception(f"Missing data for atom {atom_name}: {str(e)}")
-            
-        except KeyError as e:
-            raise Exception(f"Missing data for atom {atom_name}: {str(e)}")
-            
-        except KeyError as e:
-            raise Exception(f"Missing data for atom {atom_name}: {str(e)}")
-            
-        except KeyError as e:
+        except (KeyError, IndexError) as e:
             raise Exception(f"Missing data for atom {atom_name}: {str(e)}")
 
     def create_slv_file(self, output_path: str) -> None:
         """Generate the .slv file"""
-        with open(output_path, 'w') as f:
-            for atom_name in self.atom_order:
-                line = self.format_line(atom_name)
-                f.write(line + '\n')
+        lines = [self.format_line(atom_name) + '\n' for atom_name in self.atom_order]
+        # Size the buffer to hold the whole file so it is encoded and flushed once
+        buffer_size = max(io.DEFAULT_BUFFER_SIZE, sum(map(len, lines)))
+        with open(output_path, 'w', buffering=buffer_size) as f:
+            f.writelines(lines)
 
 def list_amber_jobs(base_directory):
     """List available jobs with AMBER results."""
     parent_dir = os.path.dirname(base_directory)
     current_dir = os.path.basename(base_directory)
-    job_dirs = {}
+    found = discover_jobs(parent_dir, ('RESP/AMBER/MOL.pdb', 'RESP/AMBER/MOL.prepi'),
+                          exclude=current_dir)
+    sorted_jobs = [name for name, _ in found]
     
-    for item in os.listdir(parent_dir):
-        if item == current_dir:
-            continue
-            
-        full_path = os.path.join(parent_dir, item)
-        if os.path.isdir(full_path):
-            resp_dir = os.path.join(full_path, 'RESP')
-            if os.path.exists(resp_dir):
-                amber_dir = os.path.join(resp_dir, 'AMBER')
-                if os.path.exists(amber_dir):
-                    if all(os.path.exists(os.path.join(amber_dir, f)) for f in ['MOL.pdb', 'MOL.prepi']):
-                        job_dirs[item] = "Ready"
-    
-    if not job_dirs:
+    if not sorted_jobs:
         print("\nNo jobs with AMBER results found in RESP/AMBER folders!")
         print(f"Looking in: {parent_dir}")
         return []
@@ -146,10 +138,10 @@ def list_amber_jobs(base_directory):
     print("\nAvailable jobs with AMBER results:")
     print("{:<5} {:<30} {:<10}".format("Index", "Directory", "Status"))
     print("-" * 45)
-    for i, job in enumerate(sorted(job_dirs.keys()), 1):
-        print("{:<5} {:<30} {:<10}".format(i, job, job_dirs[job]))
+    for i, job in enumerate(sorted_jobs, 1):
+        print("{:<5} {:<30} {:<10}".format(i, job, "Ready"))
     
-    return sorted(job_dirs.keys())
+    return sorted_jobs
 
 def process_molecule(pdb_path: str, prepi_path: str, top_path: str, output_path: str) -> None:
     """Process molecule files and generate .slv file"""
@@ -175,6 +167,7 @@ def main():
     group.add_argument('-a', '--all', action='store_true', help='Process all jobs')
     group.add_argument('-l', '--list', action='store_true', help='List available jobs')
     parser.add_argument('-s', '--start', type=int, help='Start index (1-based)', default=1)
+    parser.add_argument('-y', '--yes', action='store_true', help='Skip the confirmation prompt')
     args = parser.parse_args()
 
     base_directory = os.getcwd()
@@ -214,27 +207,34 @@ def main():
     for job in selected_jobs:
         print("- {}".format(job))
 
-    response = input("\nProcess these jobs? (y/n): ")
-    if response.lower() == 'y':
+    if args.yes or input("\nProcess these jobs? (y/n): ").lower() == 'y':
         parent_dir = os.path.dirname(base_directory)
         successful_jobs = 0
         failed_jobs = []
         
         print("\nProcessing jobs...")
-        for job_dir in selected_jobs:
-            amber_dir = os.path.join(parent_dir, job_dir, 'RESP', 'AMBER')
-            try:
+        # Each molecule is independent, so convert them in parallel worker processes
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {}
+            for job_dir in selected_jobs:
+                amber_dir = os.path.join(parent_dir, job_dir, 'RESP', 'AMBER')
                 pdb_path = os.path.join(amber_dir, 'MOL.pdb')
                 prepi_path = os.path.join(amber_dir, 'MOL.prepi')
                 top_path = os.path.join(amber_dir, 'lig.top')
                 output_path = os.path.join(amber_dir, 'lig.slv')
                 
-                process_molecule(pdb_path, prepi_path, top_path, output_path)
-                successful_jobs += 1
-                
-            except Exception as e:
-                print(f"Failed to process {job_dir}: {str(e)}")
-                failed_jobs.append(job_dir)
+                future = executor.submit(process_molecule, pdb_path, prepi_path, top_path, output_path)
+                futures[future] = job_dir
+            
+            for future in as_completed(futures):
+                job_dir = futures[future]
+                try:
+                    future.result()
+                    successful_jobs += 1
+                    
+                except Exception as e:
+                    print(f"Failed to process {job_dir}: {str(e)}")
+                    failed_jobs.append(job_dir)
         
         print("\nProcessing Summary:")
         print(f"Successfully processed: {successful_jobs}")
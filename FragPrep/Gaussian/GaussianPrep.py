@@ -4,6 +4,26 @@ import re
 import shutil
 import argparse
 
+# Charge/multiplicity line that starts the geometry block, e.g. "0 1"
+_CHARGE_MULT_RE = re.compile(r'^-?\d+\s+-?\d+$')
+
+def link_or_copy(src, dst):
+    """
+    Hard link src to dst, falling back to a plain content copy.
+
+    Parameters:
+    - src: Path to the source file
+    - dst: Path to the destination file
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        try:
+            shutil.copyfile(src, dst)
+        except shutil.SameFileError:
+            # dst is already a link to src from a previous run
+            pass
+
 def prepare_gaussian_input_batch(input_dir, output_dir, template_file):
     """
     Batch prepare Gaussian input files for multiple geometry files.
@@ -25,6 +45,10 @@ def prepare_gaussian_input_batch(input_dir, output_dir, template_file):
         os.makedirs(output_dir)
         print("Created output directory: {}".format(output_dir))
 
+    # The template is identical for every job, so read it only once
+    with open(template_file, 'r') as f:
+        template_content = f.read()
+
     found_files = False
     for filename in os.listdir(input_dir):
         if filename.endswith('.g'):
@@ -38,12 +62,12 @@ def prepare_gaussian_input_batch(input_dir, output_dir, template_file):
 
             src_g_file = os.path.join(input_dir, filename)
             dst_g_file = os.path.join(job_dir, filename)
-            shutil.copy2(src_g_file, dst_g_file)
+            link_or_copy(src_g_file, dst_g_file)
             print("Copied {} to {}".format(filename, job_dir))
 
             prepare_single_gaussian_input(
                 src_g_file,
-                template_file,
+                template_content,
                 job_dir
             )
 
@@ -52,18 +76,15 @@ def prepare_gaussian_input_batch(input_dir, output_dir, template_file):
     if not found_files:
         print("No .g files found in {}".format(input_dir))
 
-def prepare_single_gaussian_input(base_geometry_file, template_file, output_dir):
+def prepare_single_gaussian_input(base_geometry_file, template_content, output_dir):
     """
     Prepare Gaussian input file with fixed output name 'mpp.com'.
 
     Parameters:
     - base_geometry_file: Path to the file containing molecule geometries
-    - template_file: Path to the template .com file with Gaussian settings
+    - template_content: Contents of the template .com file with Gaussian settings
     - output_dir: Directory to save prepared .com files
     """
-    with open(template_file, 'r') as f:
-        template_content = f.read()
-
     with open(base_geometry_file, 'r') as f:
         geometry_lines = f.readlines()
 
@@ -73,10 +94,10 @@ def prepare_single_gaussian_input(base_geometry_file, template_file, output_dir)
     for line in geometry_lines:
         clean_line = line.strip()
 
-        if clean_line.startswith('#') or clean_line.startswith('Put') or clean_line == '':
+        if not clean_line or clean_line.startswith(('#', 'Put')):
             continue
 
-        if re.match(r'^-?\d+\s+-?\d+$', clean_line):
+        if _CHARGE_MULT_RE.match(clean_line):
             is_collecting = True
             current_molecule.append(line)
             continue
@@ -96,10 +117,12 @@ def write_gaussian_input(template, geometry_lines, output_file):
     - geometry_lines: Lines describing molecule geometry
     - output_file: Path to save the output .com file
     """
-    full_content = template.rstrip() + '\n\n' + ''.join(geometry_lines) + '\n'
+    parts = [template.rstrip().encode(), b'\n\n']
+    parts.extend(line.encode() for line in geometry_lines)
+    parts.append(b'\n')
 
-    with open(output_file, 'w') as f:
-        f.write(full_content)
+    with open(output_file, 'wb') as f:
+        f.write(b''.join(parts))
 
 def main():
     parser = argparse.ArgumentParser(description='Prepare Gaussian input files from .g files.')
@@ -1,26 +1,62 @@
 #!/usr/bin/env python3
 import os
-import subprocess
+import asyncio
 import argparse
 import datetime
 
-def check_node_availability():
+# Maximum number of sbatch calls in flight at once, to avoid hammering slurmctld
+MAX_CONCURRENT_SUBMISSIONS = 16
+
+# Number of bytes read from the end of mpp.log when checking for completion
+LOG_TAIL_BYTES = 4096
+
+# Slurm's default MaxArraySize, used when scontrol cannot report the cluster's value
+DEFAULT_MAX_ARRAY_SIZE = 1001
+
+def discover_jobs(parent_dir, require, exclude=None):
+    """Return sorted (name, path) pairs for job folders in parent_dir holding every required file."""
+    job_dirs = []
+    with os.scandir(parent_dir) as entries:
+        for entry in entries:
+            if entry.name == exclude or not entry.is_dir():
+                continue
+            prefix = entry.path + os.sep
+            if all(os.path.exists(prefix + f) for f in require):
+                job_dirs.append((entry.name, entry.path))
+    return sorted(job_dirs)
+
+async def check_node_availability():
     try:
-        process = subprocess.Popen(['sinfo', '-o', '%n %C'], 
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        stdout, stderr = process.communicate()
+        process = await asyncio.create_subprocess_exec('sinfo', '-o', '%n %C',
+                                stdout=asyncio.subprocess.PIPE,
+                                stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
         
         if process.returncode == 0:
             print("\nCurrent node availability:")
-            print(stdout)
+            print(stdout.decode())
             return True
         return False
     except Exception as e:
         print(f"Error checking nodes: {str(e)}")
         return False
 
+async def get_max_array_size():
+    """Return the cluster's MaxArraySize, or DEFAULT_MAX_ARRAY_SIZE if it cannot be read."""
+    try:
+        process = await asyncio.create_subprocess_exec('scontrol', 'show', 'config',
+                                stdout=asyncio.subprocess.PIPE,
+                                stderr=asyncio.subprocess.DEVNULL)
+        stdout, _ = await process.communicate()
+        if process.returncode == 0:
+            for line in stdout.decode().splitlines():
+                key, _, value = line.partition('=')
+                if key.strip() == 'MaxArraySize':
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_MAX_ARRAY_SIZE
+
 def check_job_completion(job_dir, jobs_dir):
     """Check if a job has completed successfully."""
     log_path = os.path.join(jobs_dir, job_dir, 'mpp.log')
@@ -28,9 +64,12 @@ def check_job_completion(job_dir, jobs_dir):
         return False, "No log file found"
     
     try:
-        with open(log_path, 'r') as f:
-            content = f.read()
-            if "Normal termination" in content:
+        # Gaussian reports termination status at the end of the log, so only read the tail
+        with open(log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - LOG_TAIL_BYTES))
+            tail = f.read().decode('ascii', 'ignore')
+            if "Normal termination" in tail:
                 return True, "Completed"
             else:
                 return False, "Incomplete or error"
@@ -39,20 +78,17 @@ def check_job_completion(job_dir, jobs_dir):
 
 def list_job_status(jobs_dir, incomplete_only=False):
     """List all jobs and their status in the specified jobs directory."""
-    job_dirs = {}
+    job_dirs = []
     
     if not os.path.isdir(jobs_dir):
         print(f"Error: '{jobs_dir}' is not a valid directory")
         return []
 
-    for item in os.listdir(jobs_dir):
-        full_path = os.path.join(jobs_dir, item)
-        if os.path.isdir(full_path):
-            mpp_path = os.path.join(full_path, 'mpp.com')
-            if os.path.exists(mpp_path):
-                completed, status = check_job_completion(item, jobs_dir)
-                if not incomplete_only or not completed:
-                    job_dirs[item] = status
+    # discover_jobs returns jobs sorted by name, so no further sorting is needed
+    for item, _ in discover_jobs(jobs_dir, ('mpp.com',)):
+        completed, status = check_job_completion(item, jobs_dir)
+        if not incomplete_only or not completed:
+            job_dirs.append((item, status))
     
     if not job_dirs:
         print("\nNo jobs found!")
@@ -62,10 +98,10 @@ def list_job_status(jobs_dir, incomplete_only=False):
     print("\nAvailable jobs in {}:".format(jobs_dir))
     print("{:<5} {:<30} {:<10}".format("Index", "Directory", "Status"))
     print("-" * 45)
-    for i, (job, status) in enumerate(sorted(job_dirs.items()), 1):
+    for i, (job, status) in enumerate(job_dirs, 1):
         print("{:<5} {:<30} {:<10}".format(i, job, status))
     
-    return [job for job, _ in sorted(job_dirs.items())]
+    return [job for job, _ in job_dirs]
 
 def generate_job_script(job_dir, jobs_dir, log_dir):
     """Generate submission script for a single job."""
@@ -107,22 +143,76 @@ exit $job_status
     os.chmod(script_path, 0o755)
     return script_path
 
-def submit_job(script_path):
+def generate_array_script(selected_jobs, jobs_dir, log_dir, chunk_number=1):
+    """Generate a SLURM job array script covering one chunk of the selected jobs."""
+    base_path = os.path.abspath(jobs_dir)
+    script_path = os.path.join(log_dir, f"submit_array_{chunk_number}.sh")
+    job_list = ' '.join(f'"{job_dir}"' for job_dir in selected_jobs)
+    
+    with open(script_path, 'w') as script:
+        script.write(f'''#!/bin/bash
+#SBATCH --job-name=gaussian_array
+#SBATCH --output={log_dir}/%A_%a.out
+#SBATCH --error={log_dir}/%A_%a.err
+#SBATCH --time=5:59:00
+#SBATCH -N 1
+#SBATCH -n 16
+#SBATCH --partition=short
+#SBATCH --array=0-{len(selected_jobs) - 1}
+
+module load gaussian/g16
+source /shared/centos7/gaussian/g16/bsd/g16.profile
+
+jobs=({job_list})
+job_dir=${{jobs[$SLURM_ARRAY_TASK_ID]}}
+
+# Set up scratch directory
+export GAUSS_SCRDIR=/scratch/$USER/gaussian_${{job_dir}}_${{SLURM_ARRAY_JOB_ID}}_${{SLURM_ARRAY_TASK_ID}}
+mkdir -p $GAUSS_SCRDIR
+
+work="{base_path}/$job_dir"
+cd "$work"
+
+echo "Starting job in $job_dir at $(date)"
+echo "Running on node: $SLURMD_NODENAME"
+g16 mpp.com
+job_status=$?
+echo "Finished job in $job_dir at $(date)"
+
+rm -rf $GAUSS_SCRDIR
+rm -f Gau-*
+
+exit $job_status
+''')
+    
+    os.chmod(script_path, 0o755)
+    return script_path
+
+async def submit_job(script_path):
     try:
-        process = subprocess.Popen(['sbatch', script_path], 
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        stdout, stderr = process.communicate()
+        process = await asyncio.create_subprocess_exec('sbatch', script_path,
+                                stdout=asyncio.subprocess.PIPE,
+                                stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
         
         if process.returncode == 0:
-            job_id = stdout.strip().split()[-1]
+            job_id = stdout.decode().strip().split()[-1]
             return True, job_id, None
         else:
-            return False, None, stderr
+            return False, None, stderr.decode()
     except Exception as e:
         return False, None, str(e)
 
+async def submit_all(script_paths):
+    """Submit all scripts concurrently, bounded by MAX_CONCURRENT_SUBMISSIONS."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_SUBMISSIONS)
+
+    async def _bounded_submit(script_path):
+        async with sem:
+            return await submit_job(script_path)
+
+    return await asyncio.gather(*(_bounded_submit(p) for p in script_paths))
+
 def main():
     parser = argparse.ArgumentParser(description='Submit Gaussian jobs.')
     group = parser.add_mutually_exclusive_group()
@@ -133,6 +223,8 @@ def main():
     parser.add_argument('-s', '--start', type=int, help='Start index (1-based)', default=1)
     parser.add_argument('--status', action='store_true', help='Show status of all jobs')
     parser.add_argument('-j', '--jobs_dir', type=str, help='Directory containing job folders', default=None)
+    parser.add_argument('-y', '--yes', action='store_true', help='Skip the confirmation prompt')
+    parser.add_argument('--no_array', action='store_true', help='Submit one SLURM job per directory instead of a single job array')
     args = parser.parse_args()
 
     # Determine the directory to scan for jobs
@@ -186,24 +278,42 @@ def main():
     for job in selected_jobs:
         print("- {}".format(job))
 
-    check_node_availability()
+    asyncio.run(check_node_availability())
 
-    response = input("\nSubmit these jobs? (y/n): ")
-    if response.lower() == 'y':
+    if args.yes or input("\nSubmit these jobs? (y/n): ").lower() == 'y':
         successful_jobs = 0
         failed_jobs = []
         
         print("\nSubmitting jobs...")
-        for job_dir in selected_jobs:
-            script_path = generate_job_script(job_dir, jobs_dir, log_dir)
-            success, job_id, error = submit_job(script_path)
+        if args.no_array:
+            script_paths = [generate_job_script(job_dir, jobs_dir, log_dir) for job_dir in selected_jobs]
+            results = asyncio.run(submit_all(script_paths))
             
-            if success:
-                print(f"Submitted {job_dir}: Job ID {job_id}")
-                successful_jobs += 1
-            else:
-                print(f"Failed to submit {job_dir}: {error}")
-                failed_jobs.append(job_dir)
+            for job_dir, (success, job_id, error) in zip(selected_jobs, results):
+                if success:
+                    print(f"Submitted {job_dir}: Job ID {job_id}")
+                    successful_jobs += 1
+                else:
+                    print(f"Failed to submit {job_dir}: {error}")
+                    failed_jobs.append(job_dir)
+        else:
+            # Each sbatch call enqueues one chunk of jobs as array tasks. Task IDs must stay
+            # below MaxArraySize, so larger selections are split across several arrays
+            chunk_size = max(1, asyncio.run(get_max_array_size()) - 1)
+            chunks = [selected_jobs[i:i + chunk_size] for i in range(0, len(selected_jobs), chunk_size)]
+            script_paths = [generate_array_script(chunk, jobs_dir, log_dir, chunk_number)
+                            for chunk_number, chunk in enumerate(chunks, 1)]
+            results = asyncio.run(submit_all(script_paths))
+            
+            for chunk, (success, job_id, error) in zip(chunks, results):
+                if success:
+                    print(f"Submitted job array {job_id} with {len(chunk)} tasks")
+                    for task_id, job_dir in enumerate(chunk):
+                        print(f"  {job_id}_{task_id}: {job_dir}")
+                    successful_jobs += len(chunk)
+                else:
+                    print(f"Failed to submit job array: {error}")
+                    failed_jobs.extend(chunk)
         
         print("\nSubmission Summary:")
         print(f"Successfully submitted: {successful_jobs}")
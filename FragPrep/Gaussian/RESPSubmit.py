@@ -5,15 +5,35 @@ import subprocess
 import argparse
 import datetime
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def get_charge_multiplicity(g_file_path):
-    """Extract charge and multiplicity from .g file using same approach as com_prep.py."""
-    try:
-        with open(g_file_path, 'r') as f:
-            geometry_lines = f.readlines()
-        
-        # Process geometry file
-        for line in geometry_lines:
+# Charge/multiplicity line that starts the geometry block, e.g. "0 1"
+_CHARGE_MULT_RE = re.compile(r'^-?\d+\s+-?\d+$')
+
+# Slurm's default MaxArraySize, used when scontrol cannot report the cluster's value
+DEFAULT_MAX_ARRAY_SIZE = 1001
+
+# Parsed (charge, multiplicity) keyed by file identity, so .g files shared between
+# fragment folders through links are only read once
+_gfile_cache = {}
+
+def discover_jobs(parent_dir, require, exclude=None):
+    """Return sorted (name, path) pairs for job folders in parent_dir holding every required file."""
+    job_dirs = []
+    with os.scandir(parent_dir) as entries:
+        for entry in entries:
+            if entry.name == exclude or not entry.is_dir():
+                continue
+            prefix = entry.path + os.sep
+            if all(os.path.exists(prefix + f) for f in require):
+                job_dirs.append((entry.name, entry.path))
+    return sorted(job_dirs)
+
+def _parse_gfile(g_file_path):
+    """Return the (charge, multiplicity) strings from a .g file, or None if absent."""
+    # Stream the file; the header line comes before the geometry, so stop at the first match
+    with open(g_file_path, 'r') as f:
+        for line in f:
             # Clean line
             clean_line = line.strip()
             
@@ -22,9 +42,21 @@ def get_charge_multiplicity(g_file_path):
                 continue
             
             # Detect charge and multiplicity line (flexible pattern)
-            if re.match(r'^-?\d+\s+-?\d+$', clean_line):
+            if _CHARGE_MULT_RE.match(clean_line):
                 parts = clean_line.split()
                 return parts[0], parts[1]
+    return None
+
+def get_charge_multiplicity(g_file_path):
+    """Extract charge and multiplicity from .g file using same approach as com_prep.py."""
+    try:
+        st = os.stat(g_file_path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        if key not in _gfile_cache:
+            _gfile_cache[key] = _parse_gfile(g_file_path)
+        result = _gfile_cache[key]
+        if result is not None:
+            return result
                 
         print(f"\nError in {os.path.basename(g_file_path)}:")
         print("Could not find valid charge and multiplicity values.")
@@ -52,90 +84,97 @@ antechamber.esp
 '''
 
 def setup_resp_folders(jobs_dir):
-    """Create RESP folders and generate appropriate mpp.com files."""
+    """Create RESP folders and generate appropriate mpp.com files.
+
+    Folders are processed in name order, so the returned dict is already sorted
+    and matches the indices reported by list_resp_jobs.
+    """
     job_dirs = {}
     
     if not os.path.isdir(jobs_dir):
         print(f"Error: '{jobs_dir}' is not a valid directory")
         return {}
     
-    for item in os.listdir(jobs_dir):
-        full_path = os.path.join(jobs_dir, item)
-        if os.path.isdir(full_path):
-            # Check for .chk and .g files
-            chk_files = [f for f in os.listdir(full_path) if f.endswith('.chk')]
-            g_files = [f for f in os.listdir(full_path) if f.endswith('.g')]
+    with os.scandir(jobs_dir) as entries:
+        job_entries = sorted((entry for entry in entries if entry.is_dir()),
+                             key=lambda entry: entry.name)
+    
+    for job_entry in job_entries:
+        item = job_entry.name
+        full_path = job_entry.path
+        
+        # Collect .chk and .g files in a single pass over the folder
+        chk_files = []
+        g_files = []
+        with os.scandir(full_path) as files:
+            for file_entry in files:
+                if file_entry.name.endswith('.chk'):
+                    chk_files.append(file_entry.name)
+                elif file_entry.name.endswith('.g'):
+                    g_files.append(file_entry.name)
+        
+        if chk_files and g_files:
+            # Get charge and multiplicity from .g file
+            g_file_path = os.path.join(full_path, g_files[0])
+            charge, multiplicity = get_charge_multiplicity(g_file_path)
             
-            if chk_files and g_files:
-                # Get charge and multiplicity from .g file
-                g_file_path = os.path.join(full_path, g_files[0])
-                charge, multiplicity = get_charge_multiplicity(g_file_path)
-                
-                if charge is None or multiplicity is None:
-                    print(f"Warning: Could not determine charge and multiplicity for {item}, skipping...")
-                    continue
-                
-                # Create RESP directory
-                resp_dir = os.path.join(full_path, 'RESP')
-                if not os.path.exists(resp_dir):
-                    os.makedirs(resp_dir)
-                    print("Created RESP directory for: {}".format(item))
-                
-                # Copy .chk file to RESP directory
-                for chk_file in chk_files:
-                    src = os.path.join(full_path, chk_file)
-                    dst = os.path.join(resp_dir, chk_file)
-                    shutil.copy2(src, dst)
-                    print("Copied {} to {}/RESP".format(chk_file, item))
-                
-                # Create mpp.com with correct charge and multiplicity
-                mpp_content = create_resp_input(charge, multiplicity)
-                mpp_path = os.path.join(resp_dir, 'mpp.com')
-                with open(mpp_path, 'w') as f:
-                    f.write(mpp_content)
-                print("Created mpp.com for {} with charge {} and multiplicity {}".format(
-                    item, charge, multiplicity))
-                
-                job_dirs[item] = "Ready"
+            if charge is None or multiplicity is None:
+                print(f"Warning: Could not determine charge and multiplicity for {item}, skipping...")
+                continue
+            
+            # Create RESP directory
+            resp_dir = os.path.join(full_path, 'RESP')
+            if not os.path.exists(resp_dir):
+                os.makedirs(resp_dir)
+                print("Created RESP directory for: {}".format(item))
+            
+            # Copy .chk file to RESP directory. The RESP run rewrites the checkpoint,
+            # so this must be a real copy rather than a link; only the contents matter.
+            for chk_file in chk_files:
+                src = os.path.join(full_path, chk_file)
+                dst = os.path.join(resp_dir, chk_file)
+                shutil.copyfile(src, dst)
+                print("Copied {} to {}/RESP".format(chk_file, item))
+            
+            # Create mpp.com with correct charge and multiplicity
+            mpp_content = create_resp_input(charge, multiplicity)
+            mpp_path = os.path.join(resp_dir, 'mpp.com')
+            with open(mpp_path, 'w') as f:
+                f.write(mpp_content)
+            print("Created mpp.com for {} with charge {} and multiplicity {}".format(
+                item, charge, multiplicity))
+            
+            job_dirs[item] = "Ready"
     
     if not job_dirs:
         print("\nNo suitable directories found!")
         return {}
         
     print("\nProcessed folders in {}:".format(jobs_dir))
-    for job in sorted(job_dirs.keys()):
+    for job in job_dirs:
         print("- {}".format(job))
         
     return job_dirs
 
 def list_resp_jobs(jobs_dir):
     """List available RESP jobs (directories with both .chk and mpp.com)."""
-    job_dirs = {}
-    
     if not os.path.isdir(jobs_dir):
         print(f"Error: '{jobs_dir}' is not a valid directory")
         return []
     
-    for item in os.listdir(jobs_dir):
-        full_path = os.path.join(jobs_dir, item)
-        if os.path.isdir(full_path):
-            resp_dir = os.path.join(full_path, 'RESP')
-            if os.path.exists(resp_dir):
-                mpp_path = os.path.join(resp_dir, 'mpp.com')
-                if os.path.exists(mpp_path):
-                    job_dirs[item] = "Ready"
+    sorted_jobs = [name for name, _ in discover_jobs(jobs_dir, ('RESP/mpp.com',))]
     
-    if not job_dirs:
+    if not sorted_jobs:
         print("\nNo RESP jobs ready! Make sure each RESP folder has mpp.com file.")
         return []
 
     print("\nAvailable RESP jobs in {}:".format(jobs_dir))
     print("{:<5} {:<30} {:<10}".format("Index", "Directory", "Status"))
     print("-" * 45)
-    for i, job in enumerate(sorted(job_dirs.keys()), 1):
-        print("{:<5} {:<30} {:<10}".format(i, job, job_dirs[job]))
+    for i, job in enumerate(sorted_jobs, 1):
+        print("{:<5} {:<30} {:<10}".format(i, job, "Ready"))
     
-    return sorted(job_dirs.keys())
+    return sorted_jobs
 
 def generate_job_script(job_dir, jobs_dir, log_dir):
     """Generate submission script for a single RESP job."""
@@ -174,6 +213,74 @@ echo "Finished RESP job in {job_dir} at $(date)"
 rm -rf $GAUSS_SCRDIR
 rm -f Gau-*
 
+exit $job_status
+''')
+    
+    os.chmod(script_path, 0o755)
+    return script_path
+
+def get_max_array_size():
+    """Return the cluster's MaxArraySize, or DEFAULT_MAX_ARRAY_SIZE if it cannot be read."""
+    try:
+        result = subprocess.run(['scontrol', 'show', 'config'], capture_output=True, text=True)
+        if result.returncode == 0:
+            for line in result.stdout.splitlines():
+                key, _, value = line.partition('=')
+                if key.strip() == 'MaxArraySize':
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_MAX_ARRAY_SIZE
+
+def generate_array_script(selected_jobs, jobs_dir, log_dir, max_running=None, chunk_number=1):
+    """Generate a SLURM job array script and manifest for one chunk of the selected RESP jobs."""
+    manifest_path = os.path.join(log_dir, f"manifest_{chunk_number}.txt")
+    script_path = os.path.join(log_dir, f"submit_resp_array_{chunk_number}.sh")
+    
+    # Line N of the manifest is the RESP directory for array task N
+    jobs_dir = os.path.abspath(jobs_dir)
+    manifest = ''.join(os.path.join(jobs_dir, job_dir, 'RESP') + '\n' for job_dir in selected_jobs)
+    with open(manifest_path, 'w') as f:
+        f.write(manifest)
+    
+    array_range = f"1-{len(selected_jobs)}"
+    if max_running:
+        array_range += f"%{max_running}"
+    
+    with open(script_path, 'w') as script:
+        script.write(f'''#!/bin/bash
+#SBATCH --job-name=resp_array
+#SBATCH --output={log_dir}/resp_%A_%a.out
+#SBATCH --error={log_dir}/resp_%A_%a.err
+#SBATCH --time=5:59:00
+#SBATCH -N 1
+#SBATCH -n 16
+#SBATCH --partition=short
+#SBATCH --array={array_range}
+
+# Load Gaussian
+module load gaussian/g16
+source /shared/centos7/gaussian/g16/bsd/g16.profile
+
+# Set up scratch directory
+export GAUSS_SCRDIR=/scratch/$USER/gaussian_resp_${{SLURM_ARRAY_JOB_ID}}_${{SLURM_ARRAY_TASK_ID}}
+mkdir -p $GAUSS_SCRDIR
+
+# Set current working directory from the manifest
+mapfile -t PATHS < {manifest_path}
+work="${{PATHS[SLURM_ARRAY_TASK_ID-1]}}"
+cd "$work"
+
+# Run job
+echo "Starting RESP job in $work at $(date)"
+g16 mpp.com
+job_status=$?
+echo "Finished RESP job in $work at $(date)"
+
+# Cleanup scratch directory and temporary files
+rm -rf $GAUSS_SCRDIR
+rm -f Gau-*
+
 exit $job_status
 ''')
     
@@ -183,21 +290,24 @@ exit $job_status
 def submit_job(script_path):
     """Submit a single job and return the job ID."""
     try:
-        process = subprocess.Popen(['sbatch', script_path], 
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        stdout, stderr = process.communicate()
+        result = subprocess.run(['sbatch', script_path], capture_output=True, text=True)
         
-        if process.returncode == 0:
+        if result.returncode == 0:
             # Extract job ID from slurm output
-            job_id = stdout.strip().split()[-1]
+            job_id = result.stdout.strip().split()[-1]
             return True, job_id, None
         else:
-            return False, None, stderr
+            return False, None, result.stderr
     except Exception as e:
         return False, None, str(e)
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description='Setup RESP folders and submit jobs.')
     parser.add_argument('--setup', action='store_true', help='Create RESP folders and generate input files')
@@ -208,6 +318,9 @@ def main():
     parser.add_argument('-l', '--list', action='store_true', help='List available jobs')
     parser.add_argument('-s', '--start', type=int, help='Start index (1-based)', default=1)
     parser.add_argument('-j', '--jobs_dir', type=str, help='Directory containing job folders', default=None)
+    parser.add_argument('-p', '--parallel', type=positive_int, help='Number of concurrent sbatch calls (default: min(16, number of jobs))')
+    parser.add_argument('--no_array', action='store_true', help='Submit one SLURM job per directory instead of a single job array')
+    parser.add_argument('--max_running', type=int, help='Maximum number of array tasks running at once')
     args = parser.parse_args()
 
     if not (args.setup or args.submit or args.list):
@@ -234,11 +347,6 @@ def main():
             return
 
         if args.submit:
-            # Create logs directory with timestamp
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_dir = os.path.join(os.getcwd(), f"resp_jobs_{timestamp}")
-            os.makedirs(log_dir, exist_ok=True)
-
             if args.all:
                 selected_jobs = available_jobs
             elif args.indices:
@@ -268,20 +376,52 @@ def main():
 
             response = input("\nSubmit these RESP jobs? (y/n): ")
             if response.lower() == 'y':
+                # Create logs directory with timestamp only once submission is confirmed
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                log_dir = os.path.join(os.getcwd(), f"resp_jobs_{timestamp}")
+                os.makedirs(log_dir, exist_ok=True)
+                
                 successful_jobs = 0
                 failed_jobs = []
                 
                 print("\nSubmitting jobs...")
-                for job_dir in selected_jobs:
-                    script_path = generate_job_script(job_dir, jobs_dir, log_dir)
-                    success, job_id, error = submit_job(script_path)
-                    
-                    if success:
-                        print(f"Submitted {job_dir}: Job ID {job_id}")
-                        successful_jobs += 1
-                    else:
-                        print(f"Failed to submit {job_dir}: {error}")
-                        failed_jobs.append(job_dir)
+                if args.no_array:
+                    # Writing scripts is cheap; the sbatch calls are I/O-bound and run concurrently
+                    script_job_pairs = [(generate_job_script(job_dir, jobs_dir, log_dir), job_dir)
+                                        for job_dir in selected_jobs]
+                    max_workers = args.parallel or min(16, len(selected_jobs))
+                
+                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                        futures = {executor.submit(submit_job, script_path): job_dir
+                                   for script_path, job_dir in script_job_pairs}
+                        for future in as_completed(futures):
+                            job_dir = futures[future]
+                            success, job_id, error = future.result()
+                        
+                            if success:
+                                print(f"Submitted {job_dir}: Job ID {job_id}")
+                                successful_jobs += 1
+                            else:
+                                print(f"Failed to submit {job_dir}: {error}")
+                                failed_jobs.append(job_dir)
+                else:
+                    # Each sbatch call enqueues one chunk of jobs as array tasks. Task IDs must
+                    # stay below MaxArraySize, so larger selections are split across several arrays
+                    chunk_size = max(1, get_max_array_size() - 1)
+                    for chunk_number, i in enumerate(range(0, len(selected_jobs), chunk_size), 1):
+                        chunk = selected_jobs[i:i + chunk_size]
+                        script_path = generate_array_script(chunk, jobs_dir, log_dir,
+                                                            args.max_running, chunk_number)
+                        success, job_id, error = submit_job(script_path)
+                        
+                        if success:
+                            print(f"Submitted RESP job array {job_id} with {len(chunk)} tasks")
+                            for task_id, job_dir in enumerate(chunk, 1):
+                                print(f"  {job_id}_{task_id}: {job_dir}")
+                            successful_jobs += len(chunk)
+                        else:
+                            print(f"Failed to submit RESP job array: {error}")
+                            failed_jobs.extend(chunk)
                 
                 print("\nSubmission Summary:")
                 print(f"Successfully submitted: {successful_jobs}")
@@ -4,57 +4,94 @@ import argparse
 import logging
 import shutil
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# SLVA line of the MMC template; groups surround the two atom counts
+_SLVA_RE = re.compile(r'(SLVA\s+)\d+(\s+1\s+MOL\s+1\s+\w+\s+!\s+Read\s+)\d+(\s+solvent atoms)')
+
 class SACPProcessor:
-    def __init__(self, sacp_path: str, template_path: str, protein_path: str = None):
+    def __init__(self, sacp_path: str, template_path: str, protein_path: str = None,
+                 materialize: bool = False):
         self.sacp_dir = Path(sacp_path)
         self.template_path = Path(template_path)
         self.protein_path = Path(protein_path) if protein_path else None
+        self.materialize = materialize
+        self.template_parts = None
+        self.protein_files = []
         
-        # Create logs directory if it doesn't exist
+        # The logs directory and log file are only created once processing starts
         self.logs_dir = Path('logs')
+        self.log_file = None
+        self.logger = logging.getLogger(__name__)
+        
+        # Validate paths
+        if not self.sacp_dir.exists():
+            raise FileNotFoundError(f"SACP directory not found: {sacp_path}")
+        if not self.template_path.exists():
+            raise FileNotFoundError(f"Template file not found: {template_path}")
+        if self.protein_path and not self.protein_path.exists():
+            raise FileNotFoundError(f"Protein directory not found: {protein_path}")
+            
+        # If we find a nested SACP directory, use that instead
+        nested_sacp = self.sacp_dir / 'SACP'
+        if nested_sacp.is_dir():
+            self.sacp_dir = nested_sacp
+        
+        # Staged protein files live next to the SACP directory, not among its molecules
+        sacp_abs = self.sacp_dir.absolute()
+        self._protein_stage = sacp_abs.parent / f'{sacp_abs.name}_protein_stage'
+        
+    def _ensure_logging(self):
+        """Set up logging to both file and console on first use."""
+        if self.log_file is not None:
+            return
+            
+        # Create logs directory if it doesn't exist
         self.logs_dir.mkdir(exist_ok=True)
         
         # Create log filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        log_file = self.logs_dir / f'sacp_processing_{timestamp}.log'
+        self.log_file = self.logs_dir / f'sacp_processing_{timestamp}.log'
         
-        # Setup logging to both file and console
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_file),
+                logging.FileHandler(self.log_file),
                 logging.StreamHandler()
             ]
         )
-        self.logger = logging.getLogger(__name__)
         
         # Log the start of processing
         self.logger.info("="*50)
         self.logger.info("Starting SACP processing")
-        self.logger.info(f"Log file: {log_file}")
+        self.logger.info(f"Log file: {self.log_file}")
         self.logger.info("="*50)
-        
-        # Validate paths
-        if not self.sacp_dir.exists():
-            raise FileNotFoundError(f"SACP directory not found: {sacp_path}")
-        if not self.template_path.exists():
-            raise FileNotFoundError(f"Template file not found: {template_path}")
-        if self.protein_path and not self.protein_path.exists():
-            raise FileNotFoundError(f"Protein directory not found: {protein_path}")
-            
-        # If we find a nested SACP directory, use that instead
-        nested_sacp = self.sacp_dir / 'SACP'
-        if nested_sacp.exists() and nested_sacp.is_dir():
-            self.sacp_dir = nested_sacp
-            
         self.logger.info(f"Processing SACP directory: {self.sacp_dir}")
         
+    def stage_protein_files(self):
+        """
+        Stage the protein files once next to the SACP directory.
+        
+        Molecule directories then only get symlinks to the staged copies.
+        """
+        self._protein_stage.mkdir(exist_ok=True)
+        
+        for item in self.protein_path.iterdir():
+            if item.is_file() and not item.name.startswith('.'):
+                staged = self._protein_stage / item.name
+                # A real copy, so writes through the molecule symlinks never reach the
+                # originals; unlink first in case an earlier run left a hard link here
+                staged.unlink(missing_ok=True)
+                shutil.copy(item, staged)
+                self.protein_files.append((staged, item.name))
+                
+        self.logger.info(f"Staged {len(self.protein_files)} protein files in {self._protein_stage}")
+        
     def copy_protein_files(self, molecule_dir: Path):
         """
-        Copy all files from protein directory to molecule directory.
+        Link the staged protein files into a molecule directory.
         
         Args:
             molecule_dir (Path): Path to molecule directory
@@ -63,57 +100,131 @@ class SACPProcessor:
             return
             
         try:
-            self.logger.info(f"Copying protein files to {molecule_dir.name}")
-            for item in self.protein_path.iterdir():
-                if item.is_file() and not item.name.startswith('.'):
-                    dest = molecule_dir / item.name
-                    shutil.copy2(item, dest)
-                    self.logger.info(f"Copied {item.name} to {molecule_dir.name}")
+            action = "Copying" if self.materialize else "Linking"
+            self.logger.info(f"{action} protein files to {molecule_dir.name}")
+            for staged, name in self.protein_files:
+                dest = molecule_dir / name
+                if self.materialize:
+                    # Never copy through a symlink from a previous run into the stage
+                    if dest.is_symlink():
+                        dest.unlink()
+                    shutil.copy(staged, dest)
+                    self.logger.info(f"Copied {name} to {molecule_dir.name}")
+                    continue
+                    
+                # Protein files are read-only inputs to MMC, so a relative symlink
+                # to the staged copy is enough and keeps the SACP tree relocatable
+                target = os.path.relpath(staged, molecule_dir)
+                try:
+                    os.symlink(target, dest)
+                except FileExistsError:
+                    # Replace the copy or link left by a previous run
+                    dest.unlink()
+                    os.symlink(target, dest)
+                self.logger.info(f"Linked {name} to {molecule_dir.name}")
                     
         except Exception as e:
-            self.logger.error(f"Error copying protein files to {molecule_dir.name}: {str(e)}")
+            self.logger.error(f"Error adding protein files to {molecule_dir.name}: {str(e)}")
             
     def get_molecule_directories(self):
         """Find all molecule directories in SACP that contain lig.slv."""
         molecule_dirs = []
-        self.logger.info("Contents of SACP directory:")
-        for item in self.sacp_dir.iterdir():
-            if not item.name.startswith('.'):
-                self.logger.info(f"Found: {item}")
-                if item.is_dir():
-                    slv_file = item / 'lig.slv'
-                    if slv_file.exists():
-                        molecule_dirs.append(item)
-                        self.logger.info(f"Found valid molecule directory: {item.name}")
+        scanned = 0
+        with os.scandir(self.sacp_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                scanned += 1
+                self.logger.debug("Found: %s", entry.path)
+                if not entry.is_dir():
+                    continue
+                try:
+                    os.stat(os.path.join(entry.path, 'lig.slv'))
+                except FileNotFoundError:
+                    continue
+                molecule_dirs.append(Path(entry.path))
+                self.logger.debug("Found valid molecule directory: %s", entry.name)
+        self.logger.info("Found %d valid molecule directories (from %d entries scanned)",
+                         len(molecule_dirs), scanned)
         return molecule_dirs
             
     def parse_slv_file(self, slv_path: Path):
         """Count atoms in lig.slv file."""
         try:
-            with open(slv_path, 'r') as f:
-                atoms = sum(1 for line in f if line.strip())
+            # Count non-blank lines on raw bytes to skip text decoding
+            with open(slv_path, 'rb') as f:
+                atoms = sum(1 for line in f if not line.isspace())
             self.logger.info(f"Counted {atoms} atoms in {slv_path}")
             return atoms
         except Exception as e:
             self.logger.error(f"Error reading {slv_path}: {str(e)}")
             return None
             
-    def update_template(self, template_content: str, atom_count: int):
-        """Update only the atom count in SLVA line."""
-        pattern = r'(SLVA\s+)\d+(\s+1\s+MOL\s+1\s+\w+\s+!\s+Read\s+)\d+(\s+solvent atoms)'
+    def prepare_template(self, template_content: str):
+        """
+        Split the template around the SLVA atom counts once.
         
-        def replace_numbers(match):
-            return f"{match.group(1)}{atom_count}{match.group(2)}{atom_count}{match.group(3)}"
+        Args:
+            template_content (str): Contents of the MMC template file
+        """
+        match = _SLVA_RE.search(template_content)
+        if match is None:
+            self.logger.warning("No SLVA line was modified in the template!")
+            self.template_parts = (template_content, None, None)
+            return
+            
+        self.template_parts = (
+            template_content[:match.start()] + match.group(1),
+            match.group(2),
+            match.group(3) + template_content[match.end():]
+        )
             
-        updated = re.sub(pattern, replace_numbers, template_content)
+    def update_template(self, atom_count: int):
+        """Update only the atom count in SLVA line."""
+        prefix, middle, suffix = self.template_parts
+        if middle is None:
+            return prefix
+        return f"{prefix}{atom_count}{middle}{atom_count}{suffix}"
+    
+    def _process_one(self, mol_dir: Path):
+        """
+        Write prot.inp and protein files for a single molecule directory.
         
-        if updated == template_content:
-            self.logger.warning("No SLVA line was modified in the template!")
+        Args:
+            mol_dir (Path): Path to molecule directory
             
-        return updated
+        Returns:
+            tuple: (directory name, success flag, error message or None)
+        """
+        self.logger.info(f"\nProcessing {mol_dir.name}")
+        
+        # Process template
+        slv_path = mol_dir / 'lig.slv'
+        atom_count = self.parse_slv_file(slv_path)
+        if atom_count is None:
+            return mol_dir.name, False, f"Could not read {slv_path}"
+        
+        try:
+            # Write new prot.inp
+            (mol_dir / 'prot.inp').write_text(self.update_template(atom_count))
+        except OSError as e:
+            self.logger.error(f"Error writing prot.inp in {mol_dir.name}: {str(e)}")
+            return mol_dir.name, False, str(e)
+        
+        # Copy protein files if protein path is provided
+        self.copy_protein_files(mol_dir)
+        
+        self.logger.info(f"Completed processing {mol_dir.name}")
+        return mol_dir.name, True, None
     
-    def process_all_molecules(self):
-        """Process all molecule directories."""
+    def process_all_molecules(self, workers: int = None):
+        """
+        Process all molecule directories.
+        
+        Args:
+            workers (int): Number of worker threads (default: min(32, 4 * CPU count))
+        """
+        self._ensure_logging()
         try:
             # Read template file
             with open(self.template_path, 'r') as f:
@@ -122,6 +233,10 @@ class SACPProcessor:
             self.logger.info("Template file content preview:")
             self.logger.info(template_content[:200] + "...")
             
+            # Split the template once; each molecule only fills in its atom count,
+            # so the shared template parts are read-only across worker threads
+            self.prepare_template(template_content)
+            
             # Get molecule directories
             mol_dirs = self.get_molecule_directories()
             self.logger.info(f"Found {len(mol_dirs)} molecule directories")
@@ -130,44 +245,38 @@ class SACPProcessor:
                 self.logger.error("No valid molecule directories found!")
                 return
             
-            # Process each directory
-            successful_count = 0
-            for mol_dir in mol_dirs:
-                self.logger.info(f"\nProcessing {mol_dir.name}")
-                
-                # Process template
-                slv_path = mol_dir / 'lig.slv'
-                atom_count = self.parse_slv_file(slv_path)
-                if atom_count is None:
-                    continue
-                
-                # Update template
-                updated_content = self.update_template(template_content, atom_count)
-                
-                # Write new prot.inp
-                out_path = mol_dir / 'prot.inp'
-                with open(out_path, 'w') as f:
-                    f.write(updated_content)
-                
-                # Copy protein files if protein path is provided
-                self.copy_protein_files(mol_dir)
-                
-                successful_count += 1
-                self.logger.info(f"Completed processing {mol_dir.name}")
+            if self.protein_path:
+                self.stage_protein_files()
+            
+            # Molecule directories are independent and the work is I/O-bound
+            max_workers = workers or min(32, (os.cpu_count() or 1) * 4)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(self._process_one, mol_dirs))
+            successful_count = sum(1 for _, ok, _ in results if ok)
             
             # Log summary
             self.logger.info("\n" + "="*50)
             self.logger.info("Processing Summary:")
             self.logger.info(f"Total molecule directories found: {len(mol_dirs)}")
             self.logger.info(f"Successfully processed: {successful_count}")
+            for name, ok, err in results:
+                if not ok:
+                    self.logger.info(f"  Failed {name}: {err}")
             if self.protein_path:
-                self.logger.info(f"Protein files copied from: {self.protein_path}")
+                self.logger.info(f"Protein files staged from: {self.protein_path}")
             self.logger.info("="*50)
                 
         except Exception as e:
             self.logger.error(f"Error during processing: {str(e)}")
             raise
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -195,6 +304,19 @@ def parse_arguments():
         help='Path to the protein directory containing files to copy'
     )
     
+    parser.add_argument(
+        '--materialize',
+        action='store_true',
+        help='Copy protein files into each molecule directory instead of symlinking them'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=positive_int,
+        default=None,
+        help='Number of molecule directories to process concurrently (default: min(32, 4 * CPU count))'
+    )
+    
     return parser.parse_args()
 
 def main():
@@ -204,9 +326,10 @@ def main():
         processor = SACPProcessor(
             args.sacp_path,
             args.template_path,
-            args.protein_path
+            args.protein_path,
+            args.materialize
         )
-        processor.process_all_molecules()
+        processor.process_all_molecules(args.workers)
         print("\nProcessing completed successfully!")
         print(f"Log file saved in: {processor.logs_dir}")
         
@@ -4,30 +4,21 @@ from pathlib import Path
 import argparse
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# Slurm's default MaxArraySize, used when scontrol cannot report the cluster's value
+DEFAULT_MAX_ARRAY_SIZE = 1001
+
 class MMCJobSubmitter:
     def __init__(self, sacp_path, mmc_path):
         self.sacp_dir = Path(sacp_path)
         self.mmc_path = Path(mmc_path)
         self.mmc_bin = self.mmc_path / 'mmc.bin'
         
-        # Create logs directory
+        # The logs directory and log file are only created once submission starts
         self.logs_dir = Path('slurm_logs')
-        self.logs_dir.mkdir(exist_ok=True)
-        
-        # Setup logging
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        log_file = self.logs_dir / f'job_submission_{timestamp}.log'
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()
-            ]
-        )
+        self.log_file = None
         self.logger = logging.getLogger(__name__)
         
         # Validate paths
@@ -40,9 +31,32 @@ class MMCJobSubmitter:
             
         # If we find a nested SACP directory, use that instead
         nested_sacp = self.sacp_dir / 'SACP'
-        if nested_sacp.exists() and nested_sacp.is_dir():
+        if nested_sacp.is_dir():
             self.sacp_dir = nested_sacp
         
+        # Absolute string forms used when writing the submission scripts
+        self.sacp_dir_str = str(self.sacp_dir.absolute())
+        self.mmc_bin_str = str(self.mmc_bin.absolute())
+        
+    def _ensure_logging(self):
+        """Create the logs directory and set up logging on first use."""
+        if self.log_file is not None:
+            return
+            
+        self.logs_dir.mkdir(exist_ok=True)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.log_file = self.logs_dir / f'job_submission_{timestamp}.log'
+        
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler(self.log_file),
+                logging.StreamHandler()
+            ]
+        )
+        
         self.logger.info(f"Processing SACP directory: {self.sacp_dir}")
         self.logger.info(f"Using MMC binary: {self.mmc_bin}")
         
@@ -50,12 +64,14 @@ class MMCJobSubmitter:
         """Create a SLURM submission script for a batch of molecule directories."""
         script_path = self.logs_dir / f'batch_{batch_number}_submit.sh'
         
-        # Generate the parallel command to process all directories in the batch
-        parallel_commands = []
-        for mol_dir in mol_dirs:
-            parallel_commands.append(
-                f"cd {mol_dir.absolute()} && {self.mmc_bin.absolute()} < prot.inp > prot.out"
-            )
+        # srun --multi-prog maps each task rank to one line of the config. The table is
+        # embedded in the script (which sbatch snapshots) and written out per job, so a
+        # later submission from the same directory cannot change a queued batch
+        multi_prog = ''.join(
+            f'{task_id} bash -c "cd {mol_dir} && {self.mmc_bin_str} < prot.inp > prot.out"\n'
+            for task_id, mol_dir in enumerate(mol_dirs)
+        )
+        conf_path = f"{self.logs_dir.absolute()}/multi_prog_${{SLURM_JOB_ID}}.conf"
         
         script_content = f"""#!/bin/bash
 #SBATCH --job-name=MMC_batch_{batch_number}
@@ -67,17 +83,103 @@ class MMCJobSubmitter:
 #SBATCH --cpus-per-task=1
 #SBATCH --partition=short
 
-module load parallel
-parallel --jobs {len(mol_dirs)} ::: {' '.join(f'"{cmd}"' for cmd in parallel_commands)}
+cat > "{conf_path}" <<'EOF'
+{multi_prog}EOF
+srun --multi-prog "{conf_path}"
+"""
+        script_path.write_text(script_content)
+        
+        # Make script executable
+        script_path.chmod(0o755)
+        
+        return script_path
+
+    def create_array_slurm_script(self, mol_dirs, max_running=None, chunk_number=1):
+        """Create a SLURM job array script with one task per molecule directory in a chunk."""
+        script_path = self.logs_dir / f'array_submit_{chunk_number}.sh'
+        
+        # Element N-1 is the molecule directory for array task N. The list lives in the
+        # script itself, which sbatch snapshots, so later submissions cannot change it
+        mol_list = ''.join(f'"{mol_dir}"\n' for mol_dir in mol_dirs)
+        
+        array_range = f"1-{len(mol_dirs)}"
+        if max_running:
+            array_range += f"%{max_running}"
+        
+        script_content = f"""#!/bin/bash
+#SBATCH --job-name=MMC_array_{chunk_number}
+#SBATCH --output={self.logs_dir}/array_slurm_%A_%a.out
+#SBATCH --error={self.logs_dir}/array_slurm_%A_%a.err
+#SBATCH --time=47:59:00
+#SBATCH --nodes=1
+#SBATCH --ntasks=1
+#SBATCH --cpus-per-task=1
+#SBATCH --partition=short
+#SBATCH --array={array_range}
+
+mol_dirs=(
+{mol_list})
+work="${{mol_dirs[SLURM_ARRAY_TASK_ID-1]}}"
+cd "$work" && {self.mmc_bin_str} < prot.inp > prot.out
 """
-        with open(script_path, 'w') as f:
-            f.write(script_content)
+        script_path.write_text(script_content)
         
         # Make script executable
         script_path.chmod(0o755)
         
         return script_path
 
+    def get_max_array_size(self):
+        """Return the cluster's MaxArraySize, or DEFAULT_MAX_ARRAY_SIZE if it cannot be read."""
+        try:
+            result = subprocess.run(['scontrol', 'show', 'config'], capture_output=True, text=True)
+            if result.returncode == 0:
+                for line in result.stdout.splitlines():
+                    key, _, value = line.partition('=')
+                    if key.strip() == 'MaxArraySize':
+                        return int(value)
+        except (OSError, ValueError):
+            pass
+        self.logger.warning(f"Could not read MaxArraySize, assuming {DEFAULT_MAX_ARRAY_SIZE}")
+        return DEFAULT_MAX_ARRAY_SIZE
+
+    def process_all_molecules_as_array(self, max_running=None):
+        """Submit all molecule directories as SLURM job arrays.
+
+        Task IDs must stay below the cluster's MaxArraySize, so larger sets of
+        molecules are split across several arrays.
+
+        Args:
+            max_running (int): Maximum number of array tasks running at once (default: no limit)
+        """
+        self._ensure_logging()
+        mol_dirs = self.get_molecule_directories()
+        if not mol_dirs:
+            self.logger.error("No directories with prot.inp found!")
+            return
+        
+        self.logger.info(f"Found {len(mol_dirs)} directories to process")
+        
+        chunk_size = max(1, self.get_max_array_size() - 1)
+        arrays = []
+        for chunk_number, i in enumerate(range(0, len(mol_dirs), chunk_size), 1):
+            chunk = mol_dirs[i:i + chunk_size]
+            script_path = self.create_array_slurm_script(chunk, max_running, chunk_number)
+            self.logger.info(f"Created array submission script: {script_path}")
+            arrays.append((chunk, self.submit_job(script_path)))
+        
+        # Print summary
+        self.logger.info("\n" + "="*50)
+        self.logger.info("Submission Summary:")
+        for chunk, job_id in arrays:
+            if job_id:
+                self.logger.info(f"Submitted job array {job_id} with {len(chunk)} tasks")
+                for task_id, mol_dir in enumerate(chunk, 1):
+                    self.logger.info(f"  {job_id}_{task_id}: {os.path.basename(mol_dir)}")
+            else:
+                self.logger.info(f"Job array submission failed for {len(chunk)} tasks")
+        self.logger.info("="*50)
+
     def submit_job(self, script_path):
         """Submit a job to SLURM."""
         try:
@@ -94,8 +196,14 @@ parallel --jobs {len(mol_dirs)} ::: {' '.join(f'"{cmd}"' for cmd in parallel_com
             self.logger.error(f"Error submitting job for {script_path.name}: {e.stderr}")
             return None
 
-    def process_all_molecules_in_batches(self, batch_size):
-        """Process and submit jobs in batches."""
+    def process_all_molecules_in_batches(self, batch_size, parallel=None):
+        """Process and submit jobs in batches.
+
+        Args:
+            batch_size (int): Number of molecule directories per batch
+            parallel (int): Number of concurrent sbatch calls (default: min(16, number of batches))
+        """
+        self._ensure_logging()
         mol_dirs = self.get_molecule_directories()
         if not mol_dirs:
             self.logger.error("No directories with prot.inp found!")
@@ -103,7 +211,7 @@ parallel --jobs {len(mol_dirs)} ::: {' '.join(f'"{cmd}"' for cmd in parallel_com
         
         self.logger.info(f"Found {len(mol_dirs)} directories to process")
         
-        submitted_jobs = []
+        batches = []
         for i in range(0, len(mol_dirs), batch_size):
             batch_dirs = mol_dirs[i:i+batch_size]
             batch_number = i // batch_size + 1
@@ -113,11 +221,15 @@ parallel --jobs {len(mol_dirs)} ::: {' '.join(f'"{cmd}"' for cmd in parallel_com
             # Create SLURM batch script
             script_path = self.create_batch_slurm_script(batch_dirs, batch_number)
             self.logger.info(f"Created batch submission script: {script_path}")
-            
-            # Submit job
-            job_id = self.submit_job(script_path)
-            if job_id:
-                submitted_jobs.append((f"batch_{batch_number}", job_id))
+            batches.append((f"batch_{batch_number}", script_path))
+        
+        # Submit jobs concurrently; sbatch calls are independent and I/O-bound
+        max_workers = parallel or min(16, len(batches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            job_ids = list(executor.map(self.submit_job, [script_path for _, script_path in batches]))
+        
+        submitted_jobs = [(batch_name, job_id)
+                          for (batch_name, _), job_id in zip(batches, job_ids) if job_id]
         
         # Print summary
         self.logger.info("\n" + "="*50)
@@ -130,14 +242,34 @@ parallel --jobs {len(mol_dirs)} ::: {' '.join(f'"{cmd}"' for cmd in parallel_com
         self.logger.info("="*50)
 
     def get_molecule_directories(self):
-        """Find all molecule directories containing prot.inp."""
+        """Find all molecule directories containing prot.inp.
+
+        Returned paths are absolute strings, so the script writers can use them as-is.
+        """
         molecule_dirs = []
-        for d in self.sacp_dir.iterdir():
-            if d.is_dir() and (d / 'prot.inp').exists():
-                molecule_dirs.append(d)
-                self.logger.info(f"Found directory with prot.inp: {d.name}")
+        scanned = 0
+        with os.scandir(self.sacp_dir_str) as entries:
+            for entry in entries:
+                scanned += 1
+                if not entry.is_dir():
+                    continue
+                try:
+                    os.stat(os.path.join(entry.path, 'prot.inp'))
+                except FileNotFoundError:
+                    continue
+                molecule_dirs.append(entry.path)
+                self.logger.debug("Found directory with prot.inp: %s", entry.name)
+        self.logger.info("Found %d directories with prot.inp (from %d entries scanned)",
+                         len(molecule_dirs), scanned)
         return molecule_dirs
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Submit MMC jobs to SLURM'
@@ -145,13 +277,19 @@ def parse_arguments():
     parser.add_argument('--sacp_path', type=str, required=True, help='Path to the SACP directory')
     parser.add_argument('--mmc_path', type=str, required=True, help='Path to the MMC program directory')
     parser.add_argument('--batch_size', type=int, default=8, help='Number of jobs per batch')
+    parser.add_argument('--parallel', type=positive_int, default=None, help='Number of concurrent sbatch calls (default: min(16, number of batches))')
+    parser.add_argument('--array', action='store_true', help='Submit one SLURM job array task per molecule instead of batches')
+    parser.add_argument('--max_running', type=int, default=None, help='Maximum number of array tasks running at once')
     return parser.parse_args()
 
 def main():
     args = parse_arguments()
     try:
         submitter = MMCJobSubmitter(args.sacp_path, args.mmc_path)
-        submitter.process_all_molecules_in_batches(args.batch_size)
+        if args.array:
+            submitter.process_all_molecules_as_array(args.max_running)
+        else:
+            submitter.process_all_molecules_in_batches(args.batch_size, args.parallel)
         print("\nJob submission completed successfully!")
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -4,13 +4,150 @@ from pathlib import Path
 import logging
 import argparse
 import math
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# Set up console logging once at import, unless the caller already configured it
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+# Number of copied molecules between progress log lines
+PROGRESS_INTERVAL = 500
+
+# Linux ioctl that clones the extents of one file into another (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Size of the reusable copy buffer; ligand files normally fit in a single read
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Copies run on a thread pool, so each thread keeps its own buffer
+_thread_local = threading.local()
+
+def _copy_with_buf(src, dst):
+    """
+    Copy file contents through a reusable per-thread buffer.
+    
+    Args:
+        src (str): Source file
+        dst (str): Destination file
+    """
+    buf = getattr(_thread_local, 'buf', None)
+    if buf is None:
+        buf = _thread_local.buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    
+    # Raw reads may return short, so always read until EOF
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            fdst.write(view[:n])
+
+def _inode_order_helps(path):
+    """
+    Decide whether reading files in inode order is worthwhile for path.
+    
+    Inode order roughly follows on-disk layout, which saves seeks on spinning disks
+    but buys nothing on SSDs.
+    
+    Args:
+        path (str): Path on the filesystem to check
+        
+    Returns:
+        bool: True only if path is on a local block device that reports itself as rotational
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    st_dev = os.stat(path).st_dev
+    dev_dir = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+    # Partitions have no queue of their own; the parent disk's queue applies
+    for queue in (os.path.join(dev_dir, 'queue'), os.path.join(dev_dir, '..', 'queue')):
+        try:
+            with open(os.path.join(queue, 'rotational')) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    # No block device behind the mount (NFS, tmpfs, overlayfs, btrfs, ...)
+    return False
+
+def _copy_file_range(src_fd, dst_fd, size):
+    """Copy size bytes with copy_file_range; raises OSError where it is unsupported."""
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError("copy_file_range not supported")
+    remaining = size
+    while remaining > 0:
+        copied = os.copy_file_range(src_fd, dst_fd, remaining)
+        if copied == 0:
+            # Some filesystems report 0 instead of failing; let the next method run
+            raise OSError(f"copy_file_range stopped with {remaining} bytes left")
+        remaining -= copied
+
+def _sendfile(src_fd, dst_fd, size):
+    """Copy size bytes with sendfile; raises OSError where it is unsupported."""
+    if not hasattr(os, 'sendfile'):
+        raise OSError("sendfile not supported")
+    # Start over in case copy_file_range wrote part of the file before failing
+    os.ftruncate(dst_fd, 0)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            raise OSError(f"sendfile stopped with {size - offset} bytes left")
+        offset += sent
+
+def _fast_copy(src, dst, preserve_metadata=False):
+    """
+    Copy a file's contents, avoiding a userspace data copy where possible.
+    
+    Tries a FICLONE reflink first, then copy_file_range, then sendfile, and finally
+    falls back to a buffered copy.
+    
+    Args:
+        src (str): Source file
+        dst (str): Destination file
+        preserve_metadata (bool): Also copy permissions, timestamps and xattrs like shutil.copy2
+    """
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            src_fd = fsrc.fileno()
+            dst_fd = fdst.fileno()
+            try:
+                if fcntl is None:
+                    raise OSError("FICLONE not supported")
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            except OSError:
+                size = os.fstat(src_fd).st_size
+                try:
+                    _copy_file_range(src_fd, dst_fd, size)
+                except OSError:
+                    _sendfile(src_fd, dst_fd, size)
+    except OSError:
+        # No in-kernel copy is available: stream the bytes through userspace
+        _copy_with_buf(src, dst)
+    if preserve_metadata:
+        shutil.copystat(src, dst)
 
 class SACPCreator:
     """
     Creates SACP directory structure and collects ligand files from the original library.
     """
     
-    def __init__(self, library_path: str, sacp_path: str, split: int = 1):
+    def __init__(self, library_path: str, sacp_path: str, split: int = 1,
+                 preserve_metadata: bool = False, use_cp: bool = False):
         """
         Initialize the SACP creator.
         
@@ -18,17 +155,16 @@ class SACPCreator:
             library_path (str): Path to the original library parent directory
             sacp_path (str): Path where the SACP directory should be created
             split (int): Number of SACP directories to create (default: 1)
+            preserve_metadata (bool): Copy file timestamps and permissions too (default: False)
+            use_cp (bool): Copy each SACP directory with one GNU cp --reflink=auto call (default: False)
         """
         self.library_path = Path(library_path)
         self.sacp_base = Path(sacp_path)
         self.split = max(1, split)  # Ensure at least 1 split
+        self.preserve_metadata = preserve_metadata
+        self.use_cp = use_cp
         self.sacp_dirs = []
         
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
         self.logger = logging.getLogger(__name__)
         
         # Validate paths
@@ -40,40 +176,170 @@ class SACPCreator:
             self.sacp_dirs = [self.sacp_base / 'SACP']
         else:
             self.sacp_dirs = [self.sacp_base / f'SACP_{i+1}' for i in range(self.split)]
+        # String forms for building per-molecule paths without Path objects
+        self.sacp_dir_strs = [os.fspath(d) for d in self.sacp_dirs]
+        self.library_path_str = os.fspath(self.library_path)
         
     def get_molecule_directories(self):
         """
         Find all molecule directories in the original library.
         
         Returns:
-            list: List of molecule directory paths
+            list: List of molecule directory paths as strings
+        """
+        with os.scandir(self.library_path_str) as entries:
+            return [entry.path for entry in entries
+                    if entry.is_dir() and entry.name != 'File_Prep']
+    
+    def _scan_amber_dir(self, molecule_dir):
+        """
+        Read the molecule's AMBER directory once.
+        
+        Args:
+            molecule_dir (str): Path to molecule directory
+            
+        Returns:
+            dict: Directory entries by name, or None if the ligand files are missing
+        """
+        amber_dir = os.path.join(molecule_dir, 'RESP', 'AMBER')
+        # One directory read answers both existence checks
+        try:
+            with os.scandir(amber_dir) as entries:
+                found = {entry.name: entry for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            self.logger.warning(f"AMBER directory not found for {os.path.basename(molecule_dir)}")
+            return None
+        
+        if 'lig.top' not in found or 'lig.slv' not in found:
+            self.logger.warning(f"Missing ligand files for {os.path.basename(molecule_dir)}")
+            return None
+            
+        return found
+    
+    def _enumerate_ligands(self, max_workers):
+        """
+        Collect the ligand files of every molecule in the library up front.
+        
+        On Linux, unless the library is on an SSD, the list is ordered by the inode of
+        lig.top, which roughly follows on-disk layout and keeps reads sequential on
+        spinning disks.
+        
+        Args:
+            max_workers (int): Number of threads reading AMBER directories
+            
+        Returns:
+            list: (molecule name, lig.top path, lig.slv path) tuples
         """
-        return [d for d in self.library_path.iterdir() 
-                if d.is_dir() and d.name != 'File_Prep']
+        mol_dirs = self.get_molecule_directories()
+        ligands = []
+        # The directory reads are independent and latency-bound on network filesystems
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            scans = list(executor.map(self._scan_amber_dir, mol_dirs))
+        for mol_dir, found in zip(mol_dirs, scans):
+            if found is None:
+                continue
+            lig_top = found['lig.top']
+            # DirEntry.inode() comes from the directory listing, so no extra stat
+            ligands.append((lig_top.inode(), os.path.basename(mol_dir),
+                            lig_top.path, found['lig.slv'].path))
+        if _inode_order_helps(self.library_path_str):
+            ligands.sort()
+        return [ligand[1:] for ligand in ligands]
     
-    def find_ligand_files(self, molecule_dir):
+    def _process_molecule(self, ligand, target_sacp_dir, log_each=False):
         """
-        Find lig.top and lig.slv files in the molecule's AMBER directory.
+        Copy the ligand files of one molecule into its SACP directory.
         
         Args:
-            molecule_dir (Path): Path to molecule directory
+            ligand (tuple): (molecule name, lig.top path, lig.slv path)
+            target_sacp_dir (str): SACP directory the molecule is assigned to
+            log_each (bool): Emit a debug line for this molecule
             
         Returns:
-            tuple: Paths to lig.top and lig.slv files, or (None, None) if not found
+            bool: True once the ligand files are copied
         """
-        amber_dir = molecule_dir / 'RESP' / 'AMBER'
-        if not amber_dir.exists():
-            self.logger.warning(f"AMBER directory not found for {molecule_dir.name}")
-            return None, None
+        mol_name, lig_top, lig_slv = ligand
+        new_mol_dir = os.path.join(target_sacp_dir, mol_name)
+        
+        # Create molecule directory in SACP and copy files
+        try:
+            os.mkdir(new_mol_dir)
+        except FileExistsError:
+            pass
+        _fast_copy(lig_top, os.path.join(new_mol_dir, 'lig.top'), self.preserve_metadata)
+        _fast_copy(lig_slv, os.path.join(new_mol_dir, 'lig.slv'), self.preserve_metadata)
+        
+        if log_each:
+            self.logger.debug("Copied ligand files for %s to %s", mol_name, os.path.basename(target_sacp_dir))
+        return True
+    
+    def _copy_chunk(self, ligands, target_sacp_dir, max_workers):
+        """
+        Copy the ligand files of a block of molecules into one SACP directory.
+        
+        Args:
+            ligands (list): (molecule name, lig.top, lig.slv) tuples assigned to target_sacp_dir
+            target_sacp_dir (str): SACP directory to copy into
+            max_workers (int): Number of copy threads
             
-        lig_top = amber_dir / 'lig.top'
-        lig_slv = amber_dir / 'lig.slv'
+        Returns:
+            int: Number of molecules copied successfully
+        """
+        # Molecules are independent and the work is syscall/IO-bound, so overlap it in threads
+        successful_copies = 0
+        # Check the level once rather than per molecule
+        log_each = self.logger.isEnabledFor(logging.DEBUG)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._process_molecule, ligand, target_sacp_dir, log_each)
+                       for ligand in ligands]
+            for future in as_completed(futures):
+                if future.result():
+                    successful_copies += 1
+                    if successful_copies % PROGRESS_INTERVAL == 0:
+                        self.logger.info("Copied ligand files for %d/%d molecules in %s",
+                                         successful_copies, len(ligands), os.path.basename(target_sacp_dir))
+        return successful_copies
+    
+    def _copy_chunk_with_cp(self, ligands, target_sacp_dir):
+        """
+        Copy a block of molecules into one SACP directory with a single cp call.
         
-        if not lig_top.exists() or not lig_slv.exists():
-            self.logger.warning(f"Missing ligand files for {molecule_dir.name}")
-            return None, None
+        A staging tree of molname/lig.* symlinks is built next to the SACP directory
+        and copied with dereferencing, so GNU cp can reflink every file in one process.
+        
+        Args:
+            ligands (list): (molecule name, lig.top, lig.slv) tuples assigned to target_sacp_dir
+            target_sacp_dir (str): SACP directory to copy into
+            
+        Returns:
+            int: Number of molecules copied successfully
+        """
+        if not ligands:
+            return 0
             
-        return lig_top, lig_slv
+        staging = tempfile.mkdtemp(prefix='.cp_staging_', dir=os.path.dirname(target_sacp_dir) or '.')
+        try:
+            # cp applies the staging root's mode to the SACP directory; mkdtemp makes it 0700
+            os.chmod(staging, os.stat(target_sacp_dir).st_mode & 0o7777)
+            for mol_name, lig_top, lig_slv in ligands:
+                stage_dir = os.path.join(staging, mol_name)
+                os.mkdir(stage_dir)
+                os.symlink(os.path.abspath(lig_top), os.path.join(stage_dir, 'lig.top'))
+                os.symlink(os.path.abspath(lig_slv), os.path.join(stage_dir, 'lig.slv'))
+            
+            cmd = ['cp', '-rL', '--reflink=auto']
+            if self.preserve_metadata:
+                cmd.append('--preserve=mode,timestamps')
+            cmd += [os.path.join(staging, '.'), target_sacp_dir]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"cp failed for {os.path.basename(target_sacp_dir)}: {result.stderr.strip()}")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            
+        self.logger.info("Copied ligand files for %d molecules to %s with cp",
+                         len(ligands), os.path.basename(target_sacp_dir))
+        return len(ligands)
     
     def create_sacp_structure(self):
         """
@@ -81,39 +347,46 @@ class SACPCreator:
         """
         try:
             # Create all SACP directories
-            for sacp_dir in self.sacp_dirs:
-                sacp_dir.mkdir(parents=True, exist_ok=True)
+            for sacp_dir in self.sacp_dir_strs:
+                os.makedirs(sacp_dir, exist_ok=True)
                 self.logger.info(f"Created SACP directory: {sacp_dir}")
             
-            # Get all molecule directories
-            mol_dirs = self.get_molecule_directories()
+            max_threads = min(32, (os.cpu_count() or 1) * 4)
+            
+            # Find the ligand files of every molecule, in inode order
+            ligands = self._enumerate_ligands(max_threads)
             
             # Calculate molecules per directory
-            total_mols = len(mol_dirs)
+            total_mols = len(ligands)
             mols_per_dir = math.ceil(total_mols / self.split)
             
-            # Process each molecule directory
-            successful_copies = 0
-            for idx, mol_dir in enumerate(mol_dirs):
-                # Determine which SACP directory to use
-                sacp_idx = min(idx // mols_per_dir, self.split - 1)
-                target_sacp_dir = self.sacp_dirs[sacp_idx]
-                
-                mol_name = mol_dir.name
-                new_mol_dir = target_sacp_dir / mol_name
-                
-                # Find ligand files
-                lig_top, lig_slv = self.find_ligand_files(mol_dir)
-                if lig_top is None or lig_slv is None:
-                    continue
-                
-                # Create molecule directory in SACP and copy files
-                new_mol_dir.mkdir(exist_ok=True)
-                shutil.copy2(lig_top, new_mol_dir / 'lig.top')
-                shutil.copy2(lig_slv, new_mol_dir / 'lig.slv')
-                
-                successful_copies += 1
-                self.logger.info(f"Copied ligand files for {mol_name} to {target_sacp_dir.name}")
+            # Molecules go to the SACP directories in contiguous blocks of mols_per_dir;
+            # the SACP directories already exist, so workers only create leaf directories
+            chunks = [(ligands[sacp_idx * mols_per_dir:(sacp_idx + 1) * mols_per_dir], target_sacp_dir)
+                      for sacp_idx, target_sacp_dir in enumerate(self.sacp_dir_strs)]
+            
+            use_cp = self.use_cp
+            if use_cp and (not sys.platform.startswith('linux') or shutil.which('cp') is None):
+                self.logger.warning("--use_cp needs GNU cp on Linux, falling back to the built-in copy")
+                use_cp = False
+            
+            if use_cp:
+                # The cp processes do the work, so threads are enough to run them side by side
+                with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                    counts = executor.map(lambda chunk: self._copy_chunk_with_cp(*chunk), chunks)
+                successful_copies = sum(counts)
+            elif self.split > 1:
+                # Each SACP directory is an independent shard; give each its own process
+                # so the Python-side work is not serialised by the GIL
+                processes = min(self.split, os.cpu_count() or 1)
+                threads = max(1, max_threads // processes)
+                with multiprocessing.Pool(processes) as pool:
+                    counts = pool.starmap(_worker_copy_chunk,
+                                          [(self, chunk, target_sacp_dir, threads)
+                                           for chunk, target_sacp_dir in chunks])
+                successful_copies = sum(counts)
+            else:
+                successful_copies = self._copy_chunk(ligands, self.sacp_dir_strs[0], max_threads)
             
             self.logger.info(f"Successfully processed {successful_copies} molecules across {self.split} directories")
             
@@ -135,20 +408,22 @@ class SACPCreator:
             for sacp_dir in self.sacp_dirs:
                 molecule_count = 0
                 
-                for mol_dir in sacp_dir.iterdir():
-                    if not mol_dir.is_dir():
-                        continue
+                with os.scandir(sacp_dir) as entries:
+                    for entry in entries:
+                        if not entry.is_dir():
+                            continue
+                            
+                        molecule_count += 1
+                        # One directory read instead of a stat per ligand file
+                        with os.scandir(entry.path) as files:
+                            names = {f.name for f in files}
                         
-                    molecule_count += 1
-                    lig_top = mol_dir / 'lig.top'
-                    lig_slv = mol_dir / 'lig.slv'
-                    
-                    if not lig_top.exists() or not lig_slv.exists():
-                        self.logger.error(f"Missing files in {sacp_dir.name}/{mol_dir.name}")
-                        all_correct = False
+                        if 'lig.top' not in names or 'lig.slv' not in names:
+                            self.logger.error("Missing files in %s/%s", sacp_dir.name, entry.name)
+                            all_correct = False
                 
                 total_molecules += molecule_count
-                self.logger.info(f"Molecules in {sacp_dir.name}: {molecule_count}")
+                self.logger.info("Molecules in %s: %d", sacp_dir.name, molecule_count)
             
             self.logger.info(f"Total molecules across all SACP directories: {total_molecules}")
             return all_correct
@@ -157,6 +432,10 @@ class SACPCreator:
             self.logger.error(f"Error during verification: {str(e)}")
             return False
 
+def _worker_copy_chunk(creator, ligands, target_sacp_dir, max_workers):
+    """Process pool entry point: copy one SACP directory's share of the molecules."""
+    return creator._copy_chunk(ligands, target_sacp_dir, max_workers)
+
 def parse_arguments():
     """
     Parse command line arguments.
@@ -199,6 +478,24 @@ def parse_arguments():
         help='Number of SACP directories to create (default: 1)'
     )
     
+    parser.add_argument(
+        '--preserve_metadata',
+        action='store_true',
+        help='Preserve timestamps and permissions of the copied ligand files'
+    )
+    
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Re-check every SACP directory for lig.top and lig.slv after copying'
+    )
+    
+    parser.add_argument(
+        '--use_cp',
+        action='store_true',
+        help='Copy each SACP directory with one GNU cp --reflink=auto call (Linux only)'
+    )
+    
     return parser.parse_args()
 
 def main():
@@ -211,14 +508,18 @@ def main():
         creator = SACPCreator(
             library_path=args.library_path,
             sacp_path=args.sacp_path,
-            split=args.split
+            split=args.split,
+            preserve_metadata=args.preserve_metadata,
+            use_cp=args.use_cp
         )
         
         # Create the SACP structure and copy files
         creator.create_sacp_structure()
         
-        # Verify the structure
-        if creator.verify_sacp_structure():
+        # Verify the structure only on request; it re-reads every directory just written
+        if not args.verify:
+            print("SACP creation completed successfully")
+        elif creator.verify_sacp_structure():
             print("SACP creation completed and verified successfully")
         else:
             print("SACP creation completed with errors, please check the logs")
@@ -231,5 +532,4 @@ def main():
 
 if __name__ == "__main__":
     import textwrap
-    import sys
     sys.exit(main())